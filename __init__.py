@@ -3,8 +3,9 @@ Multi-File Archive Format (MFAF) library for Python.
 This library provides functionality to read, create, and modify MFAF files.
 """
 
-from .core import MFAFFile, MFAFEntry
+from .core import MFAFFile, MFAFEntry, FLAG_CONTENT_CRC, FLAG_COMPRESSED_ZLIB_DICT
 from .exceptions import MFAFError
 
-__all__ = ['MFAFFile', 'MFAFEntry', 'MFAFError']
+__all__ = ['MFAFFile', 'MFAFEntry', 'MFAFError', 'FLAG_CONTENT_CRC',
+           'FLAG_COMPRESSED_ZLIB_DICT']
 __version__ = '0.1.0'
\ No newline at end of file
@@ -0,0 +1,128 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled fast path for packing MFAF entry metadata.
+
+Emits the same bytes as packing MFAFEntry._metadata maps with msgpack, writing
+the fixed-schema parts of every entry map straight into the output bytearray. Build it in place with
+``cythonize -i _mfaf_meta.pyx``; core falls back to the Python loop when the
+module is not compiled.
+"""
+
+from cpython.bytearray cimport PyByteArray_AS_STRING, PyByteArray_GET_SIZE, PyByteArray_Resize
+from libc.stdint cimport uint64_t
+from libc.string cimport memcpy
+
+
+cdef inline unsigned char* _grow(bytearray out, Py_ssize_t n) except NULL:
+    """Extend ``out`` by ``n`` bytes and return a pointer to the new tail."""
+    cdef Py_ssize_t size = PyByteArray_GET_SIZE(out)
+    PyByteArray_Resize(out, size + n)
+    return <unsigned char*>PyByteArray_AS_STRING(out) + size
+
+
+cdef inline void _put_key_uint(bytearray out, unsigned char key, uint64_t value) except *:
+    """Append a one-letter key and an unsigned value in the smallest msgpack int, as Packer does."""
+    cdef int width, i
+    cdef unsigned char tag
+    cdef unsigned char* p
+    if value < 0x80:
+        p = _grow(out, 3)
+        p[0] = 0xa1
+        p[1] = key
+        p[2] = value
+        return
+    if value < 0x100:
+        width, tag = 1, 0xcc
+    elif value < 0x10000:
+        width, tag = 2, 0xcd
+    elif value < 0x100000000:
+        width, tag = 4, 0xce
+    else:
+        width, tag = 8, 0xcf
+    p = _grow(out, 3 + width)
+    p[0] = 0xa1
+    p[1] = key
+    p[2] = tag
+    for i in range(width):
+        p[3 + i] = (value >> (8 * (width - 1 - i))) & 0xff
+
+
+cdef inline void _put_key_str(bytearray out, unsigned char key, value, packer) except *:
+    """Append a one-letter key and a string value, as msgpack's Packer would."""
+    cdef unsigned char* p = _grow(out, 2)
+    p[0] = 0xa1
+    p[1] = key
+    if type(value) is not str:
+        packer.pack(value)
+        with packer.getbuffer() as buffer:
+            out.extend(buffer)
+        packer.reset()
+        return
+
+    cdef bytes encoded = (<str>value).encode('utf-8')
+    cdef Py_ssize_t n = len(encoded)
+    cdef Py_ssize_t header
+    if n < 32:
+        header = 1
+    elif n < 0x100:
+        header = 2
+    elif n < 0x10000:
+        header = 3
+    else:
+        header = 5
+    p = _grow(out, header + n)
+    if header == 1:
+        p[0] = 0xa0 | n
+    elif header == 2:
+        p[0] = 0xd9
+        p[1] = n
+    elif header == 3:
+        p[0] = 0xda
+        p[1] = (n >> 8) & 0xff
+        p[2] = n & 0xff
+    else:
+        p[0] = 0xdb
+        p[1] = (n >> 24) & 0xff
+        p[2] = (n >> 16) & 0xff
+        p[3] = (n >> 8) & 0xff
+        p[4] = n & 0xff
+    memcpy(p + header, <char*>encoded, n)
+
+
+def pack_entries(list entries, packer, bytearray out, bint content_crc, stored_sizes):
+    """
+    Append the metadata map of every entry to ``out``.
+
+    Args:
+        entries: MFAFEntry objects, in archive order
+        packer: msgpack.Packer (autoreset=False) used for attributes and other free-form values
+        out: Buffer receiving the packed maps
+        content_crc: Whether to emit each entry's content CRC under 'c'
+        stored_sizes: Compressed sizes when content is deflated, otherwise None
+    """
+    cdef Py_ssize_t i, n = len(entries)
+    cdef bint compressed = stored_sizes is not None
+    cdef unsigned char* p
+    for i in range(n):
+        entry = entries[i]
+        attributes = entry.attributes
+        p = _grow(out, 1)
+        p[0] = 0x84 + bool(attributes) + content_crc + compressed
+        _put_key_str(out, ord('n'), entry.name, packer)
+        _put_key_uint(out, ord('o'), entry.offset)
+        _put_key_uint(out, ord('s'), stored_sizes[i] if compressed else entry.size)
+        _put_key_str(out, ord('m'), entry.mime_type, packer)
+        if not (attributes or content_crc or compressed):
+            continue
+        if attributes:
+            packer.pack('a')
+            packer.pack(attributes)
+        if content_crc:
+            packer.pack('c')
+            packer.pack(entry.crc)
+        if compressed:
+            packer.pack('u')
+            packer.pack(entry.size)
+        with packer.getbuffer() as buffer:
+            out.extend(buffer)
+        packer.reset()
@@ -3,14 +3,24 @@ Core implementation of the MFAF library.
 Provides classes and methods to read, create, and modify MFAF files.
 """
 
+import errno
+import mmap
 import os
+import platform
+import stat
 import struct
+import sys
+import tempfile
+import warnings
 import msgpack
 import zlib
-from typing import Dict, List, Any, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from typing import Dict, List, Any, Optional, Tuple, Union
 from .exceptions import (
     MFAFMagicError, MFAFSizeError, MFAFCRCError, 
-    MFAFRangeError, MFAFMsgPackError, MFAFVersionError
+    MFAFRangeError, MFAFMsgPackError, MFAFVersionError,
+    MFAFCompressionError, MFAFError
 )
 
 # Magic numbers
@@ -20,6 +30,163 @@ FOOTER_MAGIC = b'ENDMAF\x00\x00'
 # Constants
 HEADER_SIZE = 64
 FOOTER_SIZE = 64
+COPY_BUFFER_SIZE = 4 << 20
+# Entries up to this size are copied into one write batch; larger mapped ones are
+# worth a copy_file_range/sendfile call, larger in-memory ones an iovec of their own
+GATHER_MAX_SIZE = 64 << 10
+
+# Metadata goes through msgpack's streaming Packer/Unpacker, which are only fast
+# when its C extension is loaded; the pure-Python fallback is several times slower.
+if msgpack.Packer.__module__ == 'msgpack.fallback':
+    warnings.warn(
+        "msgpack is running its pure-Python fallback; MFAF metadata encoding and "
+        "decoding will be slow. Install a msgpack wheel with the C extension.",
+        RuntimeWarning
+    )
+
+# Optional compiled metadata packer (see _mfaf_meta.pyx)
+try:
+    from ._mfaf_meta import pack_entries as _pack_entries
+except ImportError:
+    _pack_entries = None
+
+# Header and footer layouts, compiled once
+_HEADER_STRUCT = struct.Struct('<8sQQQIHHI20x')
+_FOOTER_STRUCT = struct.Struct('<8sQI44x')
+
+# Header flag bits (bit 0: global compression, bit 1: encryption, both reserved)
+FLAG_CONTENT_CRC = 1 << 2
+FLAG_COMPRESSED_ZLIB_DICT = 1 << 3
+
+# Shared deflate dictionary: the first bytes of the first entries
+ZDICT_ENTRIES = 16
+ZDICT_PREFIX_SIZE = 4096
+# Deflate never looks back further than its 32 KiB window; a longer dictionary is wasted
+ZDICT_MAX_SIZE = 32 << 10
+
+# fastcrc folds CRC-32 with PCLMULQDQ on x86-64 and the CRC32 instructions on
+# ARMv8; elsewhere (or when it is not installed) zlib is used. Both compute the
+# same IEEE 802.3 checksum, so the on-disk format does not depend on the choice.
+try:
+    from fastcrc import crc32 as _fastcrc32
+except ImportError:
+    _fastcrc32 = None
+
+if _fastcrc32 is not None and platform.machine().lower() in ('x86_64', 'amd64', 'aarch64', 'arm64'):
+    def _crc32(data, value: int = 0) -> int:
+        return _fastcrc32.iso_hdlc(data, value)
+else:
+    _crc32 = zlib.crc32
+
+
+_IOV_MAX = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+
+
+def _write_all(fd: int, buffers: List[Any]):
+    """Write every buffer to ``fd``, gathering them into writev calls where available."""
+    pending = [memoryview(buf) for buf in buffers if len(buf)]
+    if not hasattr(os, 'writev'):
+        for view in pending:
+            while view:
+                view = view[os.write(fd, view):]
+        return
+    i = 0
+    while i < len(pending):
+        n = os.writev(fd, pending[i:i + _IOV_MAX])
+        # Skip the buffers written in full and trim a partially written one
+        while n:
+            size = len(pending[i])
+            if n >= size:
+                n -= size
+                i += 1
+            else:
+                pending[i] = pending[i][n:]
+                n = 0
+
+
+def _copy_stream(src, dst_fd: int, length: int):
+    """Copy exactly ``length`` bytes from ``src`` to ``dst_fd`` in bounded chunks."""
+    remaining = length
+    while remaining:
+        chunk = src.read(min(remaining, COPY_BUFFER_SIZE))
+        if not chunk:
+            raise MFAFSizeError("Source ended before the expected entry size")
+        _write_all(dst_fd, [chunk])
+        remaining -= len(chunk)
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    return os.copy_file_range(src_fd, dst_fd, count, offset_src=offset)
+
+
+def _sendfile(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+# In-kernel copy primitives, best first; Windows has neither
+_KERNEL_COPIES = [copy for name, copy in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile))
+                  if hasattr(os, name)]
+_KERNEL_COPY_UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, length: int) -> int:
+    """
+    Copy ``length`` bytes at ``offset`` of ``src_fd`` to the current position of
+    ``dst_fd`` without passing them through user space.
+    
+    Returns:
+        Number of bytes copied; the caller copies any remainder itself
+    """
+    copied = 0
+    for copy in _KERNEL_COPIES:
+        try:
+            while copied < length:
+                n = copy(src_fd, dst_fd, offset + copied, min(length - copied, 1 << 30))
+                if n == 0:
+                    raise MFAFSizeError("Source ended before the expected entry size")
+                copied += n
+            break
+        except OSError as e:
+            if e.errno not in _KERNEL_COPY_UNSUPPORTED:
+                raise
+    return copied
+
+
+# glibc's posix_fallocate falls back to writing a byte into every block on
+# filesystems without native support (NFS, many FUSE mounts), which costs more
+# I/O than it saves. On Linux call fallocate(2) itself, which fails there instead.
+_native_fallocate = None
+if sys.platform.startswith('linux'):
+    try:
+        import ctypes
+        _native_fallocate = ctypes.CDLL(None, use_errno=True).fallocate64
+        _native_fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong)
+    except (ImportError, OSError, AttributeError):
+        _native_fallocate = None
+_PREALLOCATE_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOSYS}
+
+
+def _preallocate(fd: int, length: int):
+    """
+    Reserve ``length`` bytes for ``fd`` where the filesystem can do so cheaply.
+    
+    Contiguous extents are allocated up front and a full disk fails before any
+    copying; where allocation would have to be emulated nothing is reserved.
+    """
+    if _native_fallocate is not None:
+        if _native_fallocate(fd, 0, 0, length) != 0:
+            err = ctypes.get_errno()
+            if err not in _PREALLOCATE_UNSUPPORTED:
+                raise OSError(err, os.strerror(err))
+    elif hasattr(os, 'posix_fallocate') and not sys.platform.startswith('linux'):
+        # Other systems' posix_fallocate fails rather than emulates
+        try:
+            os.posix_fallocate(fd, 0, length)
+        except OSError as e:
+            if e.errno not in _PREALLOCATE_UNSUPPORTED:
+                raise
+    else:
+        os.ftruncate(fd, length)
 
 
 class MFAFEntry:
@@ -27,14 +194,199 @@ class MFAFEntry:
     Represents a single file entry in an MFAF archive.
     """
     
+    __slots__ = ('_name', '_mime_type', 'size', 'attributes', 'offset', 'crc', '_content',
+                 '_source', '_mmap', '_file', '_data_offset', '_stored_size', '_zdict')
+    
+    # Bumped on every rename so archives can tell when their name index is stale
+    _renames = 0
+    
     def __init__(self, name: str, content: bytes = b'', mime_type: str = 'application/octet-stream', 
                  attributes: Optional[Dict[str, Any]] = None):
-        self.name = name
+        self._name = name
         self.content = content
         self.mime_type = mime_type
         self.attributes = attributes or {}
         self.offset = 0
-        self.size = len(content)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, value: str):
+        self._name = value
+        MFAFEntry._renames += 1
+
+    @property
+    def mime_type(self) -> str:
+        return self._mime_type
+
+    @mime_type.setter
+    def mime_type(self, value: str):
+        # A handful of MIME types repeat across every entry; share one string each
+        self._mime_type = sys.intern(value) if type(value) is str else value
+
+    @property
+    def content(self) -> bytes:
+        """Entry content, read from the source file or archive mapping on demand."""
+        if self._zdict is not None:
+            # Inflate on every access rather than pinning the whole entry in memory
+            return b''.join(self._inflate())
+        if self._mmap is not None:
+            # Read lazily on first access and keep the bytes from then on
+            content = self._mapping()[self._data_offset:self._data_offset + self.size]
+            if self.crc is not None and _crc32(content) & 0xffffffff != self.crc:
+                raise MFAFCRCError(f"Content checksum mismatch for entry '{self.name}'")
+            self._content = content
+            self._mmap = None
+            self._file = None
+        if self._source is not None:
+            with open(self._source, 'rb') as f:
+                return f.read(self.size)
+        return self._content
+
+    @content.setter
+    def content(self, value: bytes):
+        self._content = value
+        self._source = None
+        self._mmap = None
+        self._file = None
+        self._data_offset = 0
+        self._stored_size = 0
+        self._zdict = None
+        self.size = len(value)
+        self.crc = None
+
+    def _mapping(self) -> mmap.mmap:
+        """Return the archive mapping backing this entry, failing clearly once it is closed."""
+        if self._file is None or self._file.closed or self._mmap.closed:
+            raise MFAFError(f"Entry '{self.name}' belongs to an archive that has been closed")
+        return self._mmap
+
+    def _inflate(self):
+        """Yield the inflated content of a compressed entry in bounded chunks, verifying it."""
+        mm = self._mapping()
+        end = self._data_offset + self._stored_size
+        decompressor = zlib.decompressobj(zdict=self._zdict)
+        size = crc = 0
+        try:
+            for start in range(self._data_offset, end, COPY_BUFFER_SIZE):
+                data = mm[start:min(start + COPY_BUFFER_SIZE, end)]
+                while data:
+                    chunk = decompressor.decompress(data, COPY_BUFFER_SIZE)
+                    data = decompressor.unconsumed_tail
+                    size += len(chunk)
+                    crc = _crc32(chunk, crc)
+                    if size > self.size:
+                        raise MFAFSizeError(f"Decompressed size mismatch for entry '{self.name}'")
+                    yield chunk
+            chunk = decompressor.flush()
+        except zlib.error as e:
+            raise MFAFCompressionError(f"Failed to decompress entry '{self.name}': {str(e)}")
+        size += len(chunk)
+        if size != self.size:
+            raise MFAFSizeError(f"Decompressed size mismatch for entry '{self.name}'")
+        if self.crc is not None and _crc32(chunk, crc) & 0xffffffff != self.crc:
+            raise MFAFCRCError(f"Content checksum mismatch for entry '{self.name}'")
+        yield chunk
+
+    def _chunks(self):
+        """Yield the content in chunks of at most COPY_BUFFER_SIZE where it is not in memory."""
+        if self._zdict is not None:
+            yield from self._inflate()
+        elif self._mmap is not None:
+            mm = self._mapping()
+            end = self._data_offset + self.size
+            for start in range(self._data_offset, end, COPY_BUFFER_SIZE):
+                yield mm[start:min(start + COPY_BUFFER_SIZE, end)]
+        elif self._source is not None:
+            remaining = self.size
+            with open(self._source, 'rb') as src:
+                while remaining and (chunk := src.read(min(remaining, COPY_BUFFER_SIZE))):
+                    remaining -= len(chunk)
+                    yield chunk
+        else:
+            yield self._content
+
+    def _prefix(self, length: int) -> bytes:
+        """Return up to ``length`` leading content bytes without reading the rest."""
+        if self._mmap is not None and self._zdict is None:
+            end = self._data_offset + min(length, self.size)
+            return self._mapping()[self._data_offset:end]
+        if self._source is not None:
+            with open(self._source, 'rb') as f:
+                return f.read(min(length, self.size))
+        if self._zdict is not None:
+            prefix = b''
+            for chunk in self._inflate():
+                prefix += chunk[:length - len(prefix)]
+                if len(prefix) >= length:
+                    break
+            return prefix
+        return self._content[:length]
+
+    def _deflate(self, zdict: bytes):
+        """Yield the content deflated against the archive's shared dictionary, chunk by chunk."""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 15, 8, zlib.Z_DEFAULT_STRATEGY, zdict=zdict)
+        for chunk in self._chunks():
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def _checksum(self) -> int:
+        """Compute the CRC-32 of the content without materializing mapped or file-backed data."""
+        if self._mmap is not None and self._zdict is None:
+            end = self._data_offset + self.size
+            with memoryview(self._mapping()) as view, view[self._data_offset:end] as data:
+                return _crc32(data) & 0xffffffff
+        crc = 0
+        for chunk in self._chunks():
+            crc = _crc32(chunk, crc)
+        return crc & 0xffffffff
+
+    def _buffer(self) -> Optional[Union[bytes, memoryview]]:
+        """Return the content if it is in memory or small and mapped, so writes can be gathered."""
+        if self._zdict is not None:
+            # Small compressed entries are inflated into the batch, larger ones streamed
+            return self.content if self.size <= GATHER_MAX_SIZE else None
+        if self._mmap is not None:
+            if self.size > GATHER_MAX_SIZE:
+                return None
+            # The caller releases the slice once it has copied it
+            return memoryview(self._mapping())[self._data_offset:self._data_offset + self.size]
+        if self._source is None:
+            return self._content
+        return None
+
+    def _write_to(self, fd: int):
+        """Write the entry content to ``fd`` without materializing it where possible."""
+        if self._zdict is not None:
+            for chunk in self._inflate():
+                _write_all(fd, [chunk])
+        elif self._mmap is not None:
+            mm = self._mapping()
+            copied = _copy_range(self._file.fileno(), fd, self._data_offset, self.size)
+            start, end = self._data_offset + copied, self._data_offset + self.size
+            if start < end:
+                with memoryview(mm) as view:
+                    _write_all(fd, [view[start:end]])
+        elif self._source is not None:
+            with open(self._source, 'rb') as src:
+                copied = _copy_range(src.fileno(), fd, 0, self.size)
+                src.seek(copied)
+                _copy_stream(src, fd, self.size - copied)
+        else:
+            _write_all(fd, [self._content])
+
+    @classmethod
+    def from_file(cls, file_path: str, name: str, mime_type: str = 'application/octet-stream',
+                  attributes: Optional[Dict[str, Any]] = None) -> 'MFAFEntry':
+        """Create an entry that streams its content from ``file_path`` on save."""
+        entry = cls(name, mime_type=mime_type, attributes=attributes)
+        entry._source = file_path
+        entry.size = os.path.getsize(file_path)
+        return entry
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert entry to dictionary representation for serialization."""
@@ -48,7 +400,26 @@ class MFAFEntry:
         if self.attributes:
             result['a'] = self.attributes
             
+        if self.crc is not None:
+            result['c'] = self.crc
+            
         return result
+
+    def _metadata(self, content_crc: bool = False, stored_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Build the metadata map written on save, with the same keys as the compiled packer.
+        
+        ``stored_size`` is the compressed size when the content is deflated.
+        """
+        item = {'n': self._name, 'o': self.offset,
+                's': self.size if stored_size is None else stored_size, 'm': self._mime_type}
+        if self.attributes:
+            item['a'] = self.attributes
+        if content_crc:
+            item['c'] = self.crc
+        if stored_size is not None:
+            item['u'] = self.size
+        return item
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'MFAFEntry':
@@ -59,7 +430,33 @@ class MFAFEntry:
             attributes=data.get('a', {})
         )
         entry.offset = data.get('o', 0)
-        entry.size = data.get('s', 0)
+        entry.size = entry._stored_size = data.get('s', 0)
+        entry.crc = data.get('c')
+        return entry
+    
+    @classmethod
+    def _mapped(cls, item: Dict[str, Any], f, mm: mmap.mmap, zdict: Optional[bytes]) -> 'MFAFEntry':
+        """
+        Create a loaded entry whose content stays in the archive mapping.
+        
+        Fills the slots directly: going through from_dict and the property
+        setters costs more than unpacking the entry itself.
+        """
+        get = item.get
+        entry = cls.__new__(cls)
+        entry._name = get('n', '')
+        mime_type = get('m', 'application/octet-stream')
+        entry._mime_type = sys.intern(mime_type) if type(mime_type) is str else mime_type
+        entry.attributes = get('a') or {}
+        entry.offset = entry._data_offset = get('o', 0)
+        entry._stored_size = get('s', 0)
+        entry.size = get('u', entry._stored_size)
+        entry.crc = get('c')
+        entry._content = b''
+        entry._source = None
+        entry._mmap = mm
+        entry._file = f
+        entry._zdict = zdict if 'u' in item else None
         return entry
 
 
@@ -71,14 +468,55 @@ class MFAFFile:
     
     def __init__(self):
         self.entries: List[MFAFEntry] = []
+        self._index: Dict[str, MFAFEntry] = {}
+        # Entry count and rename counter the index was built for
+        self._indexed = (0, MFAFEntry._renames)
         self.version = 1
         self.flags = 0
         self.total_size = HEADER_SIZE + FOOTER_SIZE
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        
+    def close(self):
+        """
+        Release the archive file and mapping held open since load().
+        
+        Content of loaded entries that has not been accessed yet is no longer
+        available afterwards; using it raises MFAFError.
+        """
+        if self._mmap is not None:
+            for entry in self.entries:
+                if entry._mmap is self._mmap:
+                    entry._file = None
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            
+    def __enter__(self) -> 'MFAFFile':
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
         
     def add_entry(self, entry: MFAFEntry):
         """Add an entry to the archive."""
+        count = len(self.entries)
+        if self._indexed == (count, MFAFEntry._renames):
+            # Keep the first entry for a duplicated name, matching list order
+            self._index.setdefault(entry.name, entry)
+            self._indexed = (count + 1, MFAFEntry._renames)
         self.entries.append(entry)
         
+    def _build_index(self):
+        """Rebuild the name index from the entry list."""
+        index: Dict[str, MFAFEntry] = {}
+        for entry in self.entries:
+            index.setdefault(entry.name, entry)
+        self._index = index
+        self._indexed = (len(self.entries), MFAFEntry._renames)
+        
     def add_file(self, file_path: str, name: Optional[str] = None, 
                  mime_type: str = 'application/octet-stream',
                  attributes: Optional[Dict[str, Any]] = None):
@@ -94,71 +532,262 @@ class MFAFFile:
         if name is None:
             name = os.path.basename(file_path)
             
-        with open(file_path, 'rb') as f:
-            content = f.read()
-            
-        entry = MFAFEntry(name, content, mime_type, attributes)
+        # Only the path and size are recorded; the bytes are streamed in save().
+        entry = MFAFEntry.from_file(file_path, name, mime_type, attributes)
         self.add_entry(entry)
         
     def save(self, file_path: str):
         """
         Save the MFAF archive to a file.
         
+        The file is written through an unbuffered descriptor: entries up to
+        GATHER_MAX_SIZE (64 KiB) are batched into COPY_BUFFER_SIZE (4 MiB)
+        writes, larger in-memory content is gathered into the same writev calls,
+        and larger file-backed content is copied in the kernel where possible and
+        otherwise in COPY_BUFFER_SIZE chunks. Compressed
+        archives are deflated entry by entry as they are written.
+        
         Args:
             file_path: Path where to save the archive
         """
-        # Calculate content offset and metadata offset
-        content_offset = HEADER_SIZE
-        content_size = sum(len(entry.content) for entry in self.entries)
-        
-        # Set offsets for each entry
-        current_offset = content_offset
+        # Files added by path may have changed since they were added: take
+        # their current size, and recompute their checksum below
         for entry in self.entries:
-            entry.offset = current_offset
-            current_offset += entry.size
+            if entry._source is not None:
+                entry.size = os.path.getsize(entry._source)
+                entry.crc = None
+                
+        if self.flags & FLAG_CONTENT_CRC:
+            self._compute_content_crcs()
             
-        metadata_offset = content_offset + content_size
-        
-        # Serialize metadata
-        metadata_list = [entry.to_dict() for entry in self.entries]
-        metadata_bytes = msgpack.packb(metadata_list)
+        # The shared dictionary is stored at the start of the content area
+        zdict = b''
+        if self.flags & FLAG_COMPRESSED_ZLIB_DICT:
+            zdict = b''.join(entry._prefix(ZDICT_PREFIX_SIZE) for entry in self.entries[:ZDICT_ENTRIES])
+            zdict = zdict[:ZDICT_MAX_SIZE]
+            
+        # Saving over a file that entries are still mapped from or streamed out
+        # of goes through a unique sibling that keeps its mode and, where
+        # permitted, its owner; anything else is rewritten in place.
+        try:
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            st = None
+        tmp_path = None
+        if st is not None and stat.S_ISREG(st.st_mode) and self._reads_from(st):
+            target = os.path.realpath(file_path)
+            directory, name = os.path.split(target)
+            fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+        else:
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            try:
+                if tmp_path is not None:
+                    os.chmod(tmp_path, stat.S_IMODE(st.st_mode))
+                    if hasattr(os, 'chown'):
+                        try:
+                            os.chown(tmp_path, st.st_uid, st.st_gid)
+                        except PermissionError:
+                            pass
+                self._write(fd, zdict)
+            finally:
+                os.close(fd)
+            if tmp_path is not None:
+                os.replace(tmp_path, target)
+        except BaseException:
+            if tmp_path is not None:
+                os.remove(tmp_path)
+            elif st is None:
+                os.remove(file_path)
+            raise
+
+    def _reads_from(self, st: os.stat_result) -> bool:
+        """Whether entries still read from the file described by ``st``."""
+        files = {id(self._file): self._file} if self._file is not None else {}
+        sources = set()
+        for entry in self.entries:
+            if entry._file is not None:
+                files.setdefault(id(entry._file), entry._file)
+            elif entry._source is not None:
+                sources.add(entry._source)
+        for f in files.values():
+            if not f.closed and os.path.samestat(os.fstat(f.fileno()), st):
+                return True
+        for path in sources:
+            try:
+                if os.path.samestat(os.stat(path), st):
+                    return True
+            except OSError:
+                pass
+        return False
+
+    def _compute_content_crcs(self):
+        """Fill in missing per-entry content CRCs, checksumming large entries in parallel."""
+        # CRC-32 only releases the GIL on large buffers, and a future costs more
+        # than checksumming a small entry, so only large entries go to the pool
+        large = []
+        for entry in self.entries:
+            if entry.crc is None:
+                if entry.size >= COPY_BUFFER_SIZE:
+                    large.append(entry)
+                else:
+                    entry.crc = entry._checksum()
+        if not large:
+            return
+        if len(large) == 1:
+            large[0].crc = large[0]._checksum()
+            return
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for entry, crc in zip(large, executor.map(MFAFEntry._checksum, large)):
+                entry.crc = crc
+
+    def _pack_metadata(self, stored_sizes: Optional[List[int]]) -> Union[bytes, bytearray]:
+        """Serialize the entry metadata as one msgpack array."""
+        packer = msgpack.Packer(autoreset=False)
+        packer.pack_array_header(len(self.entries))
+        content_crc = bool(self.flags & FLAG_CONTENT_CRC)
+        if _pack_entries is not None:
+            metadata_bytes = bytearray(packer.bytes())
+            packer.reset()
+            _pack_entries(self.entries, packer, metadata_bytes, content_crc, stored_sizes)
+            return metadata_bytes
+        # One streaming Packer avoids building the whole list of maps first
+        pack = packer.pack
+        if stored_sizes is None:
+            for entry in self.entries:
+                pack(entry._metadata(content_crc))
+        else:
+            for entry, stored_size in zip(self.entries, stored_sizes):
+                pack(entry._metadata(content_crc, stored_size))
+        return packer.bytes()
+
+    def _pack_frame(self, content_offset: int, metadata_offset: int, metadata_end: int,
+                    checksum: int, dict_size: int) -> Tuple[memoryview, memoryview]:
+        """Pack the header and footer into one buffer and return views of both."""
+        frame = bytearray(HEADER_SIZE + FOOTER_SIZE)
+        _HEADER_STRUCT.pack_into(
+            frame, 0,
+            HEADER_MAGIC,
+            self.total_size,
+            content_offset,
+            metadata_offset,
+            len(self.entries),
+            self.version,
+            self.flags,
+            dict_size
+        )
+        _FOOTER_STRUCT.pack_into(
+            frame, HEADER_SIZE,
+            FOOTER_MAGIC,
+            metadata_end,
+            checksum & 0xffffffff
+        )
+        frame_view = memoryview(frame)
+        return frame_view[:HEADER_SIZE], frame_view[HEADER_SIZE:]
+
+    def _pack_layout(self, content_offset: int, metadata_offset: int,
+                     stored_sizes: Optional[List[int]], zdict: bytes) -> Tuple[bytes, memoryview, memoryview]:
+        """Pack the metadata, header and footer once entries are laid out up to ``metadata_offset``."""
+        metadata_bytes = self._pack_metadata(stored_sizes)
         metadata_end = metadata_offset + len(metadata_bytes)
-        
-        # Calculate total size
         self.total_size = metadata_end + FOOTER_SIZE
+        header, footer = self._pack_frame(content_offset, metadata_offset, metadata_end,
+                                          _crc32(metadata_bytes), len(zdict))
+        return metadata_bytes, header, footer
+
+    def _write(self, fd: int, zdict: bytes):
+        """Write the header, content, metadata and footer to ``fd``."""
+        if self.flags & FLAG_COMPRESSED_ZLIB_DICT:
+            self._write_compressed(fd, zdict)
+        else:
+            self._write_plain(fd)
+
+    def _write_plain(self, fd: int):
+        """Write an uncompressed archive, whose whole layout is known up front."""
+        # Lay entries out back to back with a single prefix sum; its last value
+        # is where the metadata starts
+        content_offset = HEADER_SIZE
+        offsets = list(accumulate((entry.size for entry in self.entries), initial=content_offset))
+        for entry, offset in zip(self.entries, offsets):
+            entry.offset = offset
+        metadata_bytes, header, footer = self._pack_layout(content_offset, offsets[-1], None, b'')
         
-        # Write the file
-        with open(file_path, 'wb') as f:
-            # Write header
-            header = struct.pack(
-                '<8sQQQIHH24x',
-                HEADER_MAGIC,
-                self.total_size,
-                content_offset,
-                metadata_offset,
-                len(self.entries),
-                self.version,
-                self.flags
-            )
-            f.write(header)
+        # Reserve the final size up front (pipes and devices have nothing to reserve)
+        if stat.S_ISREG(os.fstat(fd).st_mode):
+            _preallocate(fd, self.total_size)
             
-            # Write content
-            for entry in self.entries:
-                f.write(entry.content)
+        # Copy the header and small entries into one batch, flushed every
+        # COPY_BUFFER_SIZE; large in-memory content joins the same writev call
+        # as a buffer of its own, and large file-backed entries are copied in
+        # between.
+        batch = bytearray(header)
+        pending = []
+        for entry in self.entries:
+            buffer = entry._buffer()
+            if buffer is None:
+                _write_all(fd, pending + [batch])
+                batch, pending = bytearray(), []
+                entry._write_to(fd)
+            elif len(buffer) > GATHER_MAX_SIZE:
+                pending += [batch, buffer]
+                batch = bytearray()
+            elif isinstance(buffer, memoryview):
+                # Release slices of the mapping right away so it can still be closed
+                with buffer:
+                    batch += buffer
+            else:
+                batch += buffer
+            if len(batch) >= COPY_BUFFER_SIZE:
+                _write_all(fd, pending + [batch])
+                batch, pending = bytearray(), []
                 
-            # Write metadata
-            f.write(metadata_bytes)
+        pending += [batch, metadata_bytes, footer]
+        _write_all(fd, pending)
+
+    def _write_compressed(self, fd: int, zdict: bytes):
+        """Deflate entries straight into ``fd``, then write the metadata and patch the header."""
+        # Stored sizes are only known once each entry has been deflated, so the
+        # header of a regular file is written last. Pipes and devices cannot seek
+        # back: entries are deflated once beforehand just to measure them.
+        content_offset = HEADER_SIZE
+        seekable = stat.S_ISREG(os.fstat(fd).st_mode)
+        if seekable:
+            pending = [bytes(HEADER_SIZE), zdict]
+        else:
+            offset = content_offset + len(zdict)
+            measured = []
+            for entry in self.entries:
+                entry.offset = offset
+                measured.append(sum(len(data) for data in entry._deflate(zdict)))
+                offset += measured[-1]
+            metadata_bytes, header, footer = self._pack_layout(content_offset, offset, measured, zdict)
+            pending = [header, zdict]
             
-            # Write footer
-            checksum = zlib.crc32(metadata_bytes) & 0xffffffff
-            footer = struct.pack(
-                '<8sQI44x',
-                FOOTER_MAGIC,
-                metadata_end,
-                checksum
-            )
-            f.write(footer)
+        # Deflated output is flushed every COPY_BUFFER_SIZE
+        buffered = 0
+        offset = content_offset + len(zdict)
+        stored_sizes = []
+        for entry in self.entries:
+            entry.offset = offset
+            for data in entry._deflate(zdict):
+                pending.append(data)
+                offset += len(data)
+                buffered += len(data)
+                if buffered >= COPY_BUFFER_SIZE:
+                    _write_all(fd, pending)
+                    pending = []
+                    buffered = 0
+            stored_sizes.append(offset - entry.offset)
+        if seekable:
+            metadata_bytes, header, footer = self._pack_layout(content_offset, offset, stored_sizes, zdict)
             
+        pending.append(metadata_bytes)
+        pending.append(footer)
+        _write_all(fd, pending)
+        if seekable:
+            os.lseek(fd, 0, os.SEEK_SET)
+            _write_all(fd, [header])
+
     @classmethod
     def load(cls, file_path: str) -> 'MFAFFile':
         """
@@ -170,75 +799,118 @@ class MFAFFile:
         Returns:
             Loaded MFAFFile instance
         """
-        with open(file_path, 'rb') as f:
-            # Read header
-            header_data = f.read(HEADER_SIZE)
-            if len(header_data) < HEADER_SIZE:
+        f = open(file_path, 'rb')
+        try:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size < HEADER_SIZE:
                 raise MFAFSizeError("File too small to contain a valid header")
-                
-            header = struct.unpack('<8sQQQIHH24x', header_data)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            f.close()
+            raise
             
-            # Check magic number
-            if header[0] != HEADER_MAGIC:
-                raise MFAFMagicError("Invalid header magic number")
-                
-            # Extract header fields
-            magic, total_size, content_offset, metadata_offset, file_count, version, flags = header
+        # The file stays open so entries can be copied out of it in the kernel
+        try:
+            mfaf = cls._from_mapping(f, mm)
+        except BaseException:
+            mm.close()
+            f.close()
+            raise
+        return mfaf
+        
+    @classmethod
+    def _from_mapping(cls, f, mm: mmap.mmap) -> 'MFAFFile':
+        """Parse an archive from its open file and read-only mapping."""
+        # Read header
+        header = _HEADER_STRUCT.unpack_from(mm, 0)
+        
+        # Check magic number
+        if header[0] != HEADER_MAGIC:
+            raise MFAFMagicError("Invalid header magic number")
             
-            # Check version
-            if version > 1:
-                raise MFAFVersionError(f"Unsupported version: {version}")
-                
-            # Read footer
-            f.seek(-FOOTER_SIZE, os.SEEK_END)
-            footer_data = f.read(FOOTER_SIZE)
-            if len(footer_data) < FOOTER_SIZE:
-                raise MFAFSizeError("File too small to contain a valid footer")
-                
-            footer = struct.unpack('<8sQI44x', footer_data)
+        # Extract header fields
+        magic, total_size, content_offset, metadata_offset, file_count, version, flags, zdict_size = header
+        
+        # Check version
+        if version > 1:
+            raise MFAFVersionError(f"Unsupported version: {version}")
             
-            # Check footer magic number
-            if footer[0] != FOOTER_MAGIC:
-                raise MFAFMagicError("Invalid footer magic number")
-                
-            # Extract footer fields
-            footer_magic, metadata_end, checksum = footer
+        # Read footer
+        if len(mm) < HEADER_SIZE + FOOTER_SIZE:
+            raise MFAFSizeError("File too small to contain a valid footer")
             
-            # Validate sizes
-            if metadata_offset + (metadata_end - metadata_offset) + FOOTER_SIZE != total_size:
-                raise MFAFSizeError("Inconsistent size fields")
-                
-            # Read metadata
-            metadata_length = metadata_end - metadata_offset
-            f.seek(metadata_offset)
-            metadata_bytes = f.read(metadata_length)
+        footer = _FOOTER_STRUCT.unpack_from(mm, len(mm) - FOOTER_SIZE)
+        
+        # Check footer magic number
+        if footer[0] != FOOTER_MAGIC:
+            raise MFAFMagicError("Invalid footer magic number")
             
-            # Verify checksum
-            calculated_checksum = zlib.crc32(metadata_bytes) & 0xffffffff
-            if calculated_checksum != checksum:
-                raise MFAFCRCError("Metadata checksum mismatch")
-                
-            # Parse metadata
-            try:
-                metadata_list = msgpack.unpackb(metadata_bytes)
-            except Exception as e:
-                raise MFAFMsgPackError(f"Failed to parse metadata: {str(e)}")
-                
-            # Create MFAFFile instance
-            mfaf = cls()
-            mfaf.version = version
-            mfaf.flags = flags
-            mfaf.total_size = total_size
+        # Extract footer fields
+        footer_magic, metadata_end, checksum = footer
+        
+        # Validate sizes
+        if metadata_end + FOOTER_SIZE != total_size or total_size != len(mm):
+            raise MFAFSizeError("Inconsistent size fields")
+        if not HEADER_SIZE <= metadata_offset <= metadata_end:
+            raise MFAFRangeError("Metadata area lies outside the file")
+        if not HEADER_SIZE <= content_offset <= metadata_offset:
+            raise MFAFRangeError("Content area lies outside the file")
             
-            # Process entries
-            for item in metadata_list:
-                entry = MFAFEntry.from_dict(item)
-                # Read content
-                f.seek(entry.offset)
-                entry.content = f.read(entry.size)
-                mfaf.entries.append(entry)
-                
-            return mfaf
+        # Verify checksum straight from the mapping
+        with memoryview(mm) as view, view[metadata_offset:metadata_end] as metadata_view:
+            calculated_checksum = _crc32(metadata_view) & 0xffffffff
+        if calculated_checksum != checksum:
+            raise MFAFCRCError("Metadata checksum mismatch")
+            
+        # The shared deflate dictionary leads the content area
+        zdict = None
+        content_start = content_offset
+        if flags & FLAG_COMPRESSED_ZLIB_DICT:
+            content_start += zdict_size
+            if content_start > metadata_offset:
+                raise MFAFRangeError("Compression dictionary lies outside the content area")
+            zdict = mm[content_offset:content_start]
+            
+        # Create MFAFFile instance
+        mfaf = cls()
+        mfaf.version = version
+        mfaf.flags = flags
+        mfaf.total_size = total_size
+        mfaf._file = f
+        mfaf._mmap = mm
+        
+        # Parse metadata one entry at a time instead of materializing the whole
+        # list; content is only read from the mapping when accessed
+        mm.seek(metadata_offset)
+        unpacker = msgpack.Unpacker(mm, raw=False, strict_map_key=False)
+        try:
+            entry_count = unpacker.read_array_header()
+        except Exception as e:
+            raise MFAFMsgPackError(f"Failed to parse metadata: {str(e)}")
+            
+        mapped = MFAFEntry._mapped
+        entries = mfaf.entries
+        index = mfaf._index
+        try:
+            for _ in range(entry_count):
+                entry = mapped(unpacker.unpack(), f, mm, zdict)
+                if not content_start <= entry.offset <= entry.offset + entry._stored_size <= metadata_offset:
+                    raise MFAFRangeError(f"Entry '{entry.name}' lies outside the content area")
+                # 'u' only describes deflated content; stored bytes are the content otherwise
+                if entry._zdict is None and entry.size != entry._stored_size:
+                    raise MFAFSizeError(f"Uncompressed size of entry '{entry.name}' differs from its stored size")
+                entries.append(entry)
+                index.setdefault(entry._name, entry)
+        except MFAFError:
+            raise
+        except Exception as e:
+            raise MFAFMsgPackError(f"Failed to parse metadata: {str(e)}")
+        mfaf._indexed = (len(entries), MFAFEntry._renames)
+            
+        if metadata_offset + unpacker.tell() > metadata_end:
+            raise MFAFMsgPackError("Failed to parse metadata: entries run past the metadata area")
+            
+        return mfaf
             
     def get_entry(self, name: str) -> Optional[MFAFEntry]:
         """
@@ -250,10 +922,11 @@ class MFAFFile:
         Returns:
             The entry if found, None otherwise
         """
-        for entry in self.entries:
-            if entry.name == name:
-                return entry
-        return None
+        # Entries may have been renamed or added to the list directly since
+        # the index was built
+        if self._indexed != (len(self.entries), MFAFEntry._renames):
+            self._build_index()
+        return self._index.get(name)
         
     def extract_entry(self, name: str, output_path: str):
         """
@@ -268,7 +941,7 @@ class MFAFFile:
             raise KeyError(f"Entry '{name}' not found")
             
         with open(output_path, 'wb') as f:
-            f.write(entry.content)
+            entry._write_to(f.fileno())
             
     def list_entries(self) -> List[str]:
         """
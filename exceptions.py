@@ -28,4 +28,8 @@ class MFAFMsgPackError(MFAFError):
 
 class MFAFVersionError(MFAFError):
     """Raised when the version is not supported."""
+    pass
+
+class MFAFCompressionError(MFAFError):
+    """Raised when compressed entry content cannot be inflated."""
     pass
\ No newline at end of file
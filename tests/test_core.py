@@ -2,11 +2,18 @@
 Unit tests for the MFAF core module.
 """
 
+import gc
 import os
+import stat
+import struct
 import tempfile
+import threading
+import zlib
+import msgpack
 import pytest
+import core
 from core import MFAFFile, MFAFEntry
-from exceptions import MFAFMagicError, MFAFSizeError, MFAFCRCError, MFAFMsgPackError
+from exceptions import MFAFError, MFAFMagicError, MFAFSizeError, MFAFCRCError, MFAFMsgPackError, MFAFRangeError
 
 
 def test_create_empty_archive():
@@ -45,16 +52,16 @@ def test_save_and_load_archive():
         mfaf.save(tmp_path)
         
         # Load archive
-        loaded_mfaf = MFAFFile.load(tmp_path)
+        with MFAFFile.load(tmp_path) as loaded_mfaf:
         
-        # Verify loaded content
-        assert len(loaded_mfaf.entries) == 2
-        assert loaded_mfaf.entries[0].name == "file1.txt"
-        assert loaded_mfaf.entries[0].content == b"Content of file 1"
-        assert loaded_mfaf.entries[0].mime_type == "text/plain"
-        assert loaded_mfaf.entries[1].name == "file2.bin"
-        assert loaded_mfaf.entries[1].content == b"\x00\x01\x02\x03"
-        assert loaded_mfaf.entries[1].mime_type == "application/octet-stream"
+            # Verify loaded content
+            assert len(loaded_mfaf.entries) == 2
+            assert loaded_mfaf.entries[0].name == "file1.txt"
+            assert loaded_mfaf.entries[0].content == b"Content of file 1"
+            assert loaded_mfaf.entries[0].mime_type == "text/plain"
+            assert loaded_mfaf.entries[1].name == "file2.bin"
+            assert loaded_mfaf.entries[1].content == b"\x00\x01\x02\x03"
+            assert loaded_mfaf.entries[1].mime_type == "application/octet-stream"
         
     finally:
         # Clean up temporary file
@@ -78,8 +85,8 @@ def test_extract_entry():
         mfaf.save(tmp_path)
         
         # Load archive and extract entry
-        loaded_mfaf = MFAFFile.load(tmp_path)
-        loaded_mfaf.extract_entry("test.txt", extracted_path)
+        with MFAFFile.load(tmp_path) as loaded_mfaf:
+            loaded_mfaf.extract_entry("test.txt", extracted_path)
         
         # Verify extracted content
         with open(extracted_path, 'rb') as f:
@@ -124,4 +131,524 @@ def test_get_entry():
     
     # Test non-existent entry
     not_found = mfaf.get_entry("nonexistent.txt")
-    assert not_found is None
\ No newline at end of file
+    assert not_found is None
+
+def test_add_file_streams_on_save():
+    """Test that files added from disk are streamed into the saved archive."""
+    with tempfile.NamedTemporaryFile(delete=False) as src_file:
+        src_file.write(b"x" * 3000000)
+        src_path = src_file.name
+    
+    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+    
+    try:
+        mfaf = MFAFFile()
+        mfaf.add_file(src_path, "big.bin")
+        mfaf.add_entry(MFAFEntry("small.txt", b"small", "text/plain"))
+        assert mfaf.entries[0].size == 3000000
+        mfaf.save(tmp_path)
+        
+        with MFAFFile.load(tmp_path) as loaded_mfaf:
+            assert loaded_mfaf.get_entry("big.bin").content == b"x" * 3000000
+            assert loaded_mfaf.get_entry("small.txt").content == b"small"
+        
+    finally:
+        os.unlink(src_path)
+        os.unlink(tmp_path)
+
+
+def test_resave_loaded_archive_in_place():
+    """Test saving a loaded archive back over the file it was mapped from."""
+    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+    
+    try:
+        mfaf = MFAFFile()
+        mfaf.add_entry(MFAFEntry("file1.txt", b"Content of file 1", "text/plain"))
+        mfaf.save(tmp_path)
+        
+        with MFAFFile.load(tmp_path) as loaded_mfaf:
+            loaded_mfaf.add_entry(MFAFEntry("file2.txt", b"Content of file 2", "text/plain"))
+            loaded_mfaf.save(tmp_path)
+        
+        with MFAFFile.load(tmp_path) as reloaded_mfaf:
+            assert reloaded_mfaf.list_entries() == ["file1.txt", "file2.txt"]
+            assert reloaded_mfaf.entries[0].content == b"Content of file 1"
+            assert reloaded_mfaf.entries[1].content == b"Content of file 2"
+        
+    finally:
+        os.unlink(tmp_path)
+
+
+def test_save_keeps_mode_symlink_and_neighbouring_files():
+    """Test that replacing an archive keeps its mode and symlinks and leaves other files alone."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        link_path = os.path.join(tmp_dir, "link.mfaf")
+        neighbour_path = archive_path + ".tmp"
+        with open(neighbour_path, 'wb') as f:
+            f.write(b"user data")
+        
+        mfaf = MFAFFile()
+        mfaf.add_entry(MFAFEntry("file1.txt", b"Content of file 1"))
+        mfaf.save(archive_path)
+        os.chmod(archive_path, 0o600)
+        os.symlink(archive_path, link_path)
+        
+        with MFAFFile.load(link_path) as loaded_mfaf:
+            loaded_mfaf.add_entry(MFAFEntry("file2.txt", b"Content of file 2"))
+            loaded_mfaf.save(link_path)
+        
+        assert os.path.islink(link_path)
+        assert os.stat(archive_path).st_mode & 0o777 == 0o600
+        with open(neighbour_path, 'rb') as f:
+            assert f.read() == b"user data"
+        assert sorted(os.listdir(tmp_dir)) == ["archive.mfaf", "archive.mfaf.tmp", "link.mfaf"]
+        with MFAFFile.load(archive_path) as reloaded_mfaf:
+            assert reloaded_mfaf.list_entries() == ["file1.txt", "file2.txt"]
+
+
+def test_save_rewrites_unmapped_destination_in_place():
+    """Test that a destination nothing reads from keeps its inode, hard links included."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        link_path = os.path.join(tmp_dir, "hardlink.mfaf")
+        with open(archive_path, 'wb') as f:
+            f.write(b"old")
+        os.link(archive_path, link_path)
+        
+        mfaf = MFAFFile()
+        mfaf.add_entry(MFAFEntry("file1.txt", b"Content of file 1"))
+        mfaf.save(archive_path)
+        
+        assert os.path.samefile(archive_path, link_path)
+        with MFAFFile.load(link_path) as loaded_mfaf:
+            assert loaded_mfaf.get_entry("file1.txt").content == b"Content of file 1"
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs named pipes")
+@pytest.mark.parametrize("flags", [0, core.FLAG_COMPRESSED_ZLIB_DICT])
+def test_save_to_fifo(flags):
+    """Test that saving to a named pipe streams the archive into it."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fifo_path = os.path.join(tmp_dir, "archive.fifo")
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        os.mkfifo(fifo_path)
+        mfaf = MFAFFile()
+        mfaf.flags = flags
+        mfaf.add_entry(MFAFEntry("file1.txt", b"Content of file 1" * 100))
+        
+        received = []
+        
+        def read_fifo():
+            with open(fifo_path, 'rb') as f:
+                received.append(f.read())
+        
+        reader = threading.Thread(target=read_fifo)
+        reader.start()
+        mfaf.save(fifo_path)
+        reader.join()
+        
+        assert stat.S_ISFIFO(os.stat(fifo_path).st_mode)
+        with open(archive_path, 'wb') as f:
+            f.write(received[0])
+        with MFAFFile.load(archive_path) as loaded_mfaf:
+            assert loaded_mfaf.get_entry("file1.txt").content == b"Content of file 1" * 100
+
+
+def test_loaded_content_is_read_lazily():
+    """Test that loaded entry content is read on first access and then cached."""
+    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+    
+    try:
+        mfaf = MFAFFile()
+        mfaf.add_entry(MFAFEntry("test.txt", b"Hello, World!", "text/plain"))
+        mfaf.save(tmp_path)
+        
+        with MFAFFile.load(tmp_path) as loaded_mfaf:
+            entry = loaded_mfaf.get_entry("test.txt")
+            assert entry.size == 13
+            first = entry.content
+            assert first == b"Hello, World!"
+            assert entry.content is first
+        
+    finally:
+        os.unlink(tmp_path)
+
+
+@pytest.mark.filterwarnings("ignore::ResourceWarning")
+def test_entries_outliving_their_archive():
+    """Test entries used after close() fail clearly and survive their archive being dropped."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        first_path = os.path.join(tmp_dir, "first.mfaf")
+        second_path = os.path.join(tmp_dir, "second.mfaf")
+        copy_path = os.path.join(tmp_dir, "copy.mfaf")
+        extracted_path = os.path.join(tmp_dir, "extracted.bin")
+        for path, payload in ((first_path, b"A" * 10), (second_path, b"B" * 10)):
+            mfaf = MFAFFile()
+            mfaf.add_entry(MFAFEntry("file.bin", payload))
+            mfaf.save(path)
+        
+        # A closed archive's descriptor may be reused by the next open file
+        closed_mfaf = MFAFFile.load(first_path)
+        closed_mfaf.close()
+        with MFAFFile.load(second_path):
+            with pytest.raises(MFAFError):
+                closed_mfaf.extract_entry("file.bin", extracted_path)
+            with pytest.raises(MFAFError):
+                closed_mfaf.entries[0].content
+        
+        # Entries keep the archive file open after their MFAFFile is dropped
+        entries = MFAFFile.load(first_path).entries
+        gc.collect()
+        mfaf = MFAFFile()
+        for entry in entries:
+            mfaf.add_entry(entry)
+        mfaf.save(copy_path)
+        with MFAFFile.load(copy_path) as copy_mfaf:
+            assert copy_mfaf.get_entry("file.bin").content == b"A" * 10
+        
+        # The last entry going away releases the archive it was loaded from
+        del entries, entry, mfaf
+        gc.collect()
+
+
+@pytest.mark.parametrize("kernel_copy", [True, False])
+def test_extract_and_resave_with_and_without_kernel_copy(monkeypatch, kernel_copy):
+    """Test extracting and re-saving entries through both copy paths."""
+    if not kernel_copy:
+        monkeypatch.setattr(core, "_KERNEL_COPIES", [])
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        copy_path = os.path.join(tmp_dir, "copy.mfaf")
+        extracted_path = os.path.join(tmp_dir, "extracted.bin")
+        payload = os.urandom(200000)
+        
+        mfaf = MFAFFile()
+        mfaf.add_entry(MFAFEntry("small.txt", b"small", "text/plain"))
+        mfaf.add_entry(MFAFEntry("payload.bin", payload))
+        mfaf.save(archive_path)
+        
+        with MFAFFile.load(archive_path) as loaded_mfaf:
+            loaded_mfaf.extract_entry("payload.bin", extracted_path)
+            loaded_mfaf.save(copy_path)
+        
+        with open(extracted_path, 'rb') as f:
+            assert f.read() == payload
+        with open(archive_path, 'rb') as a, open(copy_path, 'rb') as b:
+            assert a.read() == b.read()
+
+
+def test_get_entry_returns_first_duplicate():
+    """Test that get_entry keeps returning the first entry for a duplicated name."""
+    mfaf = MFAFFile()
+    first = MFAFEntry("dup.txt", b"first")
+    mfaf.add_entry(first)
+    mfaf.add_entry(MFAFEntry("dup.txt", b"second"))
+    
+    assert mfaf.get_entry("dup.txt") is first
+
+
+def test_get_entry_follows_renames_and_direct_list_changes():
+    """Test that get_entry stays correct when entries are renamed or appended to the list."""
+    mfaf = MFAFFile()
+    entry = MFAFEntry("x.txt", b"x")
+    mfaf.add_entry(entry)
+    assert mfaf.get_entry("x.txt") is entry
+    
+    entry.name = "y.txt"
+    assert mfaf.get_entry("x.txt") is None
+    assert mfaf.get_entry("y.txt") is entry
+    
+    appended = MFAFEntry("z.txt", b"z")
+    mfaf.entries.append(appended)
+    assert mfaf.get_entry("z.txt") is appended
+    
+    mfaf.entries.remove(entry)
+    assert mfaf.get_entry("y.txt") is None
+    
+    # Misses on an unchanged archive use the index as it is
+    index = mfaf._index
+    assert mfaf.get_entry("missing.txt") is None
+    assert mfaf._index is index
+
+
+@pytest.mark.parametrize("mode", ["short", "no_writev"])
+def test_save_handles_short_and_unavailable_writev(monkeypatch, mode):
+    """Test that gathered writes survive short writes and platforms without writev."""
+    if mode == "short":
+        real_writev = os.writev
+        monkeypatch.setattr(os, "writev", lambda fd, buffers: real_writev(fd, [bytes(buffers[0][:5])]))
+    else:
+        monkeypatch.delattr(os, "writev")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        mfaf = MFAFFile()
+        mfaf.add_entry(MFAFEntry("file1.txt", b"Content of file 1", "text/plain"))
+        mfaf.add_entry(MFAFEntry("empty.bin", b""))
+        mfaf.add_entry(MFAFEntry("file2.txt", b"Content of file 2", "text/plain"))
+        mfaf.save(archive_path)
+        
+        with MFAFFile.load(archive_path) as loaded_mfaf:
+            assert [entry.content for entry in loaded_mfaf.entries] == [
+                b"Content of file 1", b"", b"Content of file 2"
+            ]
+
+
+def test_resave_after_changing_entries():
+    """Test that metadata stays correct when entries change between saves."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        mfaf = MFAFFile()
+        entry = MFAFEntry("file1.txt", b"Content of file 1", "text/plain")
+        mfaf.add_entry(entry)
+        mfaf.save(archive_path)
+        
+        # Shift the offset, rename, retype and add attributes before saving again
+        mfaf.entries.insert(0, MFAFEntry("file0.txt", b"Content of file 0"))
+        entry.name = "renamed.txt"
+        entry.mime_type = "text/markdown"
+        entry.attributes["author"] = "tester"
+        mfaf.save(archive_path)
+        
+        with MFAFFile.load(archive_path) as loaded_mfaf:
+            assert loaded_mfaf.list_entries() == ["file0.txt", "renamed.txt"]
+            loaded_entry = loaded_mfaf.get_entry("renamed.txt")
+            assert loaded_entry.content == b"Content of file 1"
+            assert loaded_entry.mime_type == "text/markdown"
+            assert loaded_entry.attributes == {"author": "tester"}
+
+
+def test_content_crc_flag():
+    """Test that per-entry content CRCs are stored and verified when flagged."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        mfaf = MFAFFile()
+        mfaf.flags |= core.FLAG_CONTENT_CRC
+        mfaf.add_entry(MFAFEntry("file1.txt", b"Content of file 1", "text/plain"))
+        mfaf.add_entry(MFAFEntry("file2.txt", b"Content of file 2", "text/plain", {"author": "tester"}))
+        mfaf.save(archive_path)
+        
+        with MFAFFile.load(archive_path) as loaded_mfaf:
+            assert loaded_mfaf.flags & core.FLAG_CONTENT_CRC
+            assert all(entry.crc is not None for entry in loaded_mfaf.entries)
+            assert loaded_mfaf.entries[1].content == b"Content of file 2"
+            assert loaded_mfaf.entries[1].attributes == {"author": "tester"}
+        
+        # Corrupt the first entry's content without touching the metadata
+        with open(archive_path, 'r+b') as f:
+            f.seek(core.HEADER_SIZE)
+            f.write(b"X")
+        
+        with MFAFFile.load(archive_path) as loaded_mfaf:
+            with pytest.raises(MFAFCRCError):
+                loaded_mfaf.entries[0].content
+
+
+def test_content_crc_tracks_changed_source_files():
+    """Test that files added by path are re-measured and re-checksummed on every save."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src_path = os.path.join(tmp_dir, "source.txt")
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        with open(src_path, 'wb') as f:
+            f.write(b"old")
+        mfaf = MFAFFile()
+        mfaf.flags |= core.FLAG_CONTENT_CRC
+        mfaf.add_file(src_path)
+        mfaf.save(archive_path)
+        
+        with open(src_path, 'wb') as f:
+            f.write(b"new and longer")
+        mfaf.save(archive_path)
+        
+        with MFAFFile.load(archive_path) as loaded_mfaf:
+            entry = loaded_mfaf.get_entry("source.txt")
+            assert entry.size == len(b"new and longer")
+            assert entry.crc == zlib.crc32(b"new and longer")
+            assert entry.content == b"new and longer"
+
+
+def test_load_rejects_malformed_metadata():
+    """Test that metadata which is not a msgpack entry list raises MFAFMsgPackError."""
+    metadata = b"\xc1"  # never used in msgpack
+    metadata_offset = core.HEADER_SIZE
+    metadata_end = metadata_offset + len(metadata)
+    total_size = metadata_end + core.FOOTER_SIZE
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        with open(archive_path, 'wb') as f:
+            f.write(struct.pack('<8sQQQIHH24x', core.HEADER_MAGIC, total_size,
+                                core.HEADER_SIZE, metadata_offset, 0, 1, 0))
+            f.write(metadata)
+            f.write(struct.pack('<8sQI44x', core.FOOTER_MAGIC, metadata_end, zlib.crc32(metadata)))
+        
+        with pytest.raises(MFAFMsgPackError):
+            MFAFFile.load(archive_path)
+
+
+@pytest.mark.parametrize("field_offset, value, error", [
+    (8, 12345, MFAFSizeError),          # totalSize
+    (24, 1 << 40, MFAFRangeError),      # metadataOffset past metadataEnd
+])
+def test_load_rejects_inconsistent_header(field_offset, value, error):
+    """Test that header fields disagreeing with the file are rejected."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        mfaf = MFAFFile()
+        mfaf.add_entry(MFAFEntry("test.txt", b"Hello, World!", "text/plain"))
+        mfaf.save(archive_path)
+        
+        with open(archive_path, 'r+b') as f:
+            f.seek(field_offset)
+            f.write(struct.pack('<Q', value))
+        
+        with pytest.raises(error):
+            MFAFFile.load(archive_path)
+
+
+def _write_raw_archive(path, items, content=b"", flags=0, dict_size=0):
+    """Write an archive with hand-made metadata ``items`` after ``content``."""
+    metadata = msgpack.packb(items)
+    metadata_offset = core.HEADER_SIZE + len(content)
+    metadata_end = metadata_offset + len(metadata)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<8sQQQIHHI20x', core.HEADER_MAGIC, metadata_end + core.FOOTER_SIZE,
+                            core.HEADER_SIZE, metadata_offset, len(items), 1, flags, dict_size))
+        f.write(content)
+        f.write(metadata)
+        f.write(struct.pack('<8sQI44x', core.FOOTER_MAGIC, metadata_end, zlib.crc32(metadata)))
+
+
+@pytest.mark.parametrize("item, flags, dict_size", [
+    ({"n": "a", "o": 0, "s": 8}, 0, 0),                           # inside the header
+    ({"n": "a", "o": -1, "s": 2}, 0, 0),                          # negative offset
+    ({"n": "a", "o": 70, "s": -4}, 0, 0),                         # negative size
+    ({"n": "a", "o": 64, "s": 4, "u": 4}, core.FLAG_COMPRESSED_ZLIB_DICT, 8),  # inside the dictionary
+])
+def test_load_rejects_entries_outside_content_area(item, flags, dict_size):
+    """Test that entries must lie between the content start and the metadata."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        _write_raw_archive(archive_path, [item], b"x" * 16, flags, dict_size)
+        
+        with pytest.raises(MFAFRangeError):
+            MFAFFile.load(archive_path)
+
+
+def test_load_rejects_uncompressed_size_without_compression():
+    """Test that 'u' cannot stretch an entry beyond its stored bytes when the archive is not compressed."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        _write_raw_archive(archive_path, [{"n": "a", "o": 64, "s": 0, "u": 10 ** 6}])
+        
+        with pytest.raises(MFAFSizeError):
+            MFAFFile.load(archive_path)
+
+
+def test_zlib_dict_compression_round_trip():
+    """Test saving, loading, extracting and re-saving a compressed archive."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "source.log")
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        plain_path = os.path.join(tmp_dir, "plain.mfaf")
+        extracted_path = os.path.join(tmp_dir, "extracted.log")
+        lines = b"".join(b"2024-11-14 INFO request %d served\n" % i for i in range(2000))
+        with open(source_path, 'wb') as f:
+            f.write(lines)
+        
+        mfaf = MFAFFile()
+        mfaf.flags |= core.FLAG_COMPRESSED_ZLIB_DICT | core.FLAG_CONTENT_CRC
+        mfaf.add_file(source_path, "app.log", "text/plain")
+        mfaf.add_entry(MFAFEntry("other.log", lines[:5000], "text/plain", {"author": "tester"}))
+        mfaf.add_entry(MFAFEntry("empty.bin", b""))
+        mfaf.save(archive_path)
+        assert os.path.getsize(archive_path) < len(lines) // 4
+        
+        with MFAFFile.load(archive_path) as loaded_mfaf:
+            assert loaded_mfaf.get_entry("app.log").size == len(lines)
+            assert loaded_mfaf.get_entry("other.log").content == lines[:5000]
+            assert loaded_mfaf.get_entry("other.log").attributes == {"author": "tester"}
+            assert loaded_mfaf.get_entry("empty.bin").content == b""
+            loaded_mfaf.extract_entry("app.log", extracted_path)
+            
+            # Saving without the flag writes the inflated content
+            loaded_mfaf.flags = 0
+            loaded_mfaf.save(plain_path)
+        
+        with open(extracted_path, 'rb') as f:
+            assert f.read() == lines
+        with MFAFFile.load(plain_path) as plain_mfaf:
+            assert plain_mfaf.get_entry("app.log").content == lines
+            assert plain_mfaf.get_entry("other.log").content == lines[:5000]
+
+
+def test_zlib_dict_compression_streams_in_chunks(monkeypatch):
+    """Test that entries are deflated and inflated chunk by chunk, with the dictionary capped."""
+    monkeypatch.setattr(core, "COPY_BUFFER_SIZE", 1024)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive.mfaf")
+        copy_path = os.path.join(tmp_dir, "copy.mfaf")
+        payloads = [os.urandom(64) * 200 + b"%d" % i for i in range(20)]
+        
+        mfaf = MFAFFile()
+        mfaf.flags |= core.FLAG_COMPRESSED_ZLIB_DICT | core.FLAG_CONTENT_CRC
+        for i, payload in enumerate(payloads):
+            mfaf.add_entry(MFAFEntry("file%d.bin" % i, payload))
+        mfaf.save(archive_path)
+        
+        with MFAFFile.load(archive_path) as loaded_mfaf:
+            with open(archive_path, 'rb') as f:
+                dict_size = struct.unpack_from('<I', f.read(core.HEADER_SIZE), 40)[0]
+            assert dict_size == core.ZDICT_MAX_SIZE
+            assert [entry.content for entry in loaded_mfaf.entries] == payloads
+            loaded_mfaf.save(copy_path)
+        
+        with MFAFFile.load(copy_path) as copy_mfaf:
+            assert [entry.content for entry in copy_mfaf.entries] == payloads
+
+
+@pytest.mark.parametrize("value", [0, 127, 128, 255, 256, 65536, 1 << 32, (1 << 64) - 1])
+def test_packed_metadata_uses_smallest_int_width(value):
+    """Test that offsets and sizes are packed exactly as msgpack packs the entry dict."""
+    entry = MFAFEntry("file.txt", b"", "text/plain", {"author": "tester"})
+    entry.offset = value
+    entry.size = value
+    entry.crc = 0xdeadbeef
+    
+    packed = msgpack.packb(entry._metadata(content_crc=True))
+    assert packed == msgpack.packb(entry.to_dict())
+    
+    if core._pack_entries is not None:
+        compiled = bytearray()
+        core._pack_entries([entry], msgpack.Packer(autoreset=False), compiled, True, None)
+        assert compiled == packed
+
+
+@pytest.mark.parametrize("flags", [0, core.FLAG_CONTENT_CRC, core.FLAG_COMPRESSED_ZLIB_DICT])
+def test_compiled_metadata_packer_matches_python(monkeypatch, flags):
+    """Test that the compiled metadata packer writes the same archive as the Python loop."""
+    if core._pack_entries is None:
+        pytest.skip("_mfaf_meta extension is not compiled")
+    
+    def build():
+        mfaf = MFAFFile()
+        mfaf.flags = flags
+        mfaf.add_entry(MFAFEntry("a.txt", b"Content 1", "text/plain"))
+        mfaf.add_entry(MFAFEntry("\u00e9" * 40, b"Content 2", "text/plain", {"author": "tester"}))
+        mfaf.add_entry(MFAFEntry("x" * 300, b""))
+        return mfaf
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        compiled_path = os.path.join(tmp_dir, "compiled.mfaf")
+        python_path = os.path.join(tmp_dir, "python.mfaf")
+        build().save(compiled_path)
+        monkeypatch.setattr(core, "_pack_entries", None)
+        build().save(python_path)
+        
+        with open(compiled_path, 'rb') as a, open(python_path, 'rb') as b:
+            assert a.read() == b.read()